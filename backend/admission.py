@@ -0,0 +1,166 @@
+"""
+Admission Control - Per-route concurrency lanes with bounded queues and load shedding
+"""
+import asyncio
+import json
+import math
+import time
+from collections import deque
+from typing import Dict, Any, Optional
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted (queue full or queue deadline passed)"""
+
+    def __init__(self, lane: str, reason: str, retry_after: int, status_code: int = 429):
+        super().__init__(f"{lane}: {reason}")
+        self.lane = lane
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+class Lane:
+    """A pool of concurrency slots with a bounded FIFO wait queue"""
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiters: deque = deque()
+        # Exponentially weighted service time, used to estimate Retry-After
+        self.avg_service_seconds = 1.0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def retry_after(self) -> int:
+        backlog = len(self.waiters) + self.active
+        return max(1, math.ceil(backlog / self.max_concurrency * self.avg_service_seconds))
+
+    async def acquire(self):
+        if self.active < self.max_concurrency and not self.waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+
+        if len(self.waiters) >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected(self.name, "queue full", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the deadline fired; give it back
+                self.release()
+            else:
+                waiter.cancel()
+            self.timed_out += 1
+            raise AdmissionRejected(self.name, "queue deadline exceeded", self.retry_after(), status_code=503)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                waiter.cancel()
+            raise
+        finally:
+            try:
+                self.waiters.remove(waiter)
+            except ValueError:
+                pass
+        self.admitted += 1
+
+    def release(self, service_seconds: Optional[float] = None):
+        if service_seconds is not None:
+            self.avg_service_seconds = 0.8 * self.avg_service_seconds + 0.2 * service_seconds
+        # Hand the slot straight to the next live waiter so it cannot be stolen
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "queued": len(self.waiters),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+class AdmissionController:
+    """Routes each request path to its lane; unrouted paths bypass admission entirely"""
+
+    def __init__(self):
+        self.lanes: Dict[str, Lane] = {}
+        self.routes: Dict[str, str] = {}
+
+    def add_lane(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.lanes[name] = Lane(name, max_concurrency, max_queue, queue_timeout)
+
+    def route(self, path: str, lane: str):
+        self.routes[path] = lane
+
+    def lane_for(self, method: str, path: str) -> Optional[Lane]:
+        name = self.routes.get(f"{method} {path}") or self.routes.get(path)
+        return self.lanes.get(name) if name else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: lane.stats() for name, lane in self.lanes.items()}
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying an AdmissionController to HTTP requests"""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        lane = self.controller.lane_for(scope["method"], scope["path"])
+        if lane is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await lane.acquire()
+        except AdmissionRejected as e:
+            await self._reject(send, e)
+            return
+
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            lane.release(time.monotonic() - start)
+
+    async def _reject(self, send, error: AdmissionRejected):
+        body = json.dumps({"detail": f"Server busy ({error.reason}), retry later", "lane": error.lane}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": error.status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                (b"retry-after", str(error.retry_after).encode("ascii")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+# Global instance configured by main.py
+admission = AdmissionController()
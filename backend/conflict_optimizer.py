@@ -0,0 +1,190 @@
+"""
+Conflict Optimizer - Budget/headcount allocation across agent initiatives
+Solves the allocation as an LP and reports agent pairs competing for a binding constraint
+"""
+import time
+import numpy as np
+from typing import Dict, List, Any, Sequence
+
+# Expected-return discount applied to each initiative's budget impact by risk level
+RISK_DISCOUNT = {"low": 1.0, "medium": 0.85, "high": 0.7}
+
+# Gross return expected per dollar of spend if an investment initiative fully succeeds
+INVESTMENT_RETURN_MULTIPLE = 2.0
+
+# Allocation shares within this tolerance of 0/1 count as unfunded/fully funded
+ALLOCATION_EPS = 1e-6
+
+# Maximum number of conflict pairs surfaced to the dashboard
+MAX_CONFLICTS = 5
+
+CONSTRAINT_NAMES = ["budget", "headcount"]
+
+
+class AllocationResult:
+    """Solved allocation: share of each initiative funded and which constraints bind"""
+
+    def __init__(self, names: List[str], allocation: np.ndarray, costs: np.ndarray,
+                 limits: np.ndarray, values: np.ndarray, solver: str, elapsed_ms: float):
+        self.names = names
+        self.allocation = allocation
+        self.costs = costs
+        self.limits = limits
+        self.values = values
+        self.solver = solver
+        self.elapsed_ms = elapsed_ms
+
+        usage = costs @ allocation
+        self.slack = limits - usage
+        self.binding = self.slack <= 1e-6 * np.maximum(1.0, np.abs(limits))
+
+    @property
+    def objective(self) -> float:
+        return float(self.values @ self.allocation)
+
+
+def build_problem(agents: Sequence[Any], investment_limit: float, headcount_limit: float):
+    """Turn agent decisions into (values, costs, limits) arrays
+
+    Values are the expected net dollar benefit of fully funding each initiative,
+    weighted by confidence and risk: savings (positive budgetImpact) count as their
+    expected amount; spend (negative budgetImpact) counts as its expected return
+    (INVESTMENT_RETURN_MULTIPLE per dollar) minus the spend itself, so an investment
+    unlikely to pay back has negative value and is left unfunded.
+
+    Costs has one row per constraint: net spend against the investment limit
+    (savings free up budget) and headcount reductions against the workforce limit.
+    """
+    budget = np.array([a.budgetImpact for a in agents], dtype=float)
+    headcount = np.array([a.headcountImpact for a in agents], dtype=float)
+    confidence = np.array([a.confidence for a in agents], dtype=float) / 100
+    discount = np.array([RISK_DISCOUNT.get(a.risk, 0.85) for a in agents])
+
+    expected = confidence * discount
+    savings = np.maximum(budget, 0.0)
+    spend = np.maximum(-budget, 0.0)
+    values = expected * savings + (expected * INVESTMENT_RETURN_MULTIPLE - 1.0) * spend
+    costs = np.vstack([-budget, np.maximum(0.0, -headcount)])
+    limits = np.array([float(investment_limit), float(headcount_limit)])
+    return values, costs, limits
+
+
+def _solve_lp(values: np.ndarray, costs: np.ndarray, limits: np.ndarray) -> np.ndarray:
+    from scipy.optimize import linprog
+
+    res = linprog(-values, A_ub=costs, b_ub=limits, bounds=(0, 1), method="highs")
+    if not res.success:
+        raise RuntimeError(res.message)
+    return np.clip(res.x, 0.0, 1.0)
+
+
+def _solve_greedy(values: np.ndarray, costs: np.ndarray, limits: np.ndarray) -> np.ndarray:
+    """Fractional greedy fallback: best value per unit of normalized resource use first"""
+    n = values.shape[0]
+    allocation = np.zeros(n)
+    remaining = limits.astype(float).copy()
+
+    scale = np.where(np.abs(limits) > 0, np.abs(limits), 1.0)
+    weight = np.maximum(costs, 0.0) / scale[:, None]
+    density = values / np.maximum(weight.sum(axis=0), 1e-12)
+    # Initiatives that release every resource they touch go first
+    free = (costs <= 0).all(axis=0)
+    order = np.lexsort((-density, ~free))
+
+    for i in order:
+        if values[i] <= 0:
+            continue
+        col = costs[:, i]
+        use = col > 0
+        share = 1.0
+        if use.any():
+            share = min(1.0, float(np.min(np.maximum(remaining[use], 0.0) / col[use])))
+        if share <= ALLOCATION_EPS:
+            continue
+        allocation[i] = share
+        remaining -= col * share
+    return allocation
+
+
+def optimize_allocation(agents: Sequence[Any], investment_limit: float, headcount_limit: float) -> AllocationResult:
+    """Maximize expected net value of agent initiatives under budget and headcount limits
+
+    Each initiative's funded share lies in [0, 1]; see build_problem for the objective.
+    """
+    start = time.perf_counter()
+    names = [a.name for a in agents]
+    values, costs, limits = build_problem(agents, investment_limit, headcount_limit)
+
+    try:
+        allocation = _solve_lp(values, costs, limits)
+        solver = "lp"
+    except Exception as e:
+        # scipy missing or LP infeasible; the greedy fill always yields a feasible plan
+        print(f"LP solver unavailable ({e}), using greedy allocation")
+        allocation = _solve_greedy(values, costs, limits)
+        solver = "greedy"
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return AllocationResult(names, allocation, costs, limits, values, solver, elapsed_ms)
+
+
+def find_conflicts(result: AllocationResult) -> List[Dict[str, Any]]:
+    """Pairs of agents where one is funded at the expense of another on a binding constraint
+
+    Each curtailed initiative is paired with the funded initiative consuming the
+    largest share of the constraint that blocked it.
+    """
+    x = result.allocation
+    forgone = result.values * (1 - x)
+    pairs: Dict[tuple, Dict[str, Any]] = {}
+
+    for k in np.flatnonzero(result.binding):
+        uses = result.costs[k] > 0
+        consumption = np.where(uses, result.costs[k] * x, 0.0)
+        curtailed = np.flatnonzero(uses & (x < 1 - ALLOCATION_EPS) & (forgone > 0))
+        if curtailed.size == 0 or consumption.max() <= 0:
+            continue
+        curtailed = curtailed[np.argsort(-forgone[curtailed])][:MAX_CONFLICTS]
+
+        for loser in curtailed:
+            others = consumption.copy()
+            others[loser] = 0.0
+            winner = int(np.argmax(others))
+            if others[winner] <= 0:
+                continue
+            key = (winner, int(loser))
+            if key in pairs and pairs[key]["forgone_value"] >= forgone[loser]:
+                continue
+            pairs[key] = {
+                "funded": result.names[winner],
+                "curtailed": result.names[loser],
+                "funded_share": float(x[winner]),
+                "curtailed_share": float(x[loser]),
+                "constraint": CONSTRAINT_NAMES[k],
+                "limit": float(result.limits[k]),
+                "forgone_value": float(forgone[loser]),
+                "curtailed_index": int(loser),
+            }
+
+    ranked = sorted(pairs.values(), key=lambda p: p["forgone_value"], reverse=True)
+    return ranked[:MAX_CONFLICTS]
+
+
+def find_unfunded(result: AllocationResult) -> List[Dict[str, Any]]:
+    """Spend initiatives cut back because their expected return does not cover their cost
+
+    find_conflicts only reports initiatives displaced by another on a binding
+    constraint; these are curtailed on their own value, so report them separately.
+    """
+    x = result.allocation
+    spend = result.costs[0]
+    unfunded = []
+    for i in np.flatnonzero((spend > 0) & (result.values <= 0) & (x < 1 - ALLOCATION_EPS)):
+        unfunded.append({
+            "name": result.names[i],
+            "share": float(x[i]),
+            # Confidence- and risk-weighted dollars returned per dollar spent
+            "expected_return": float(result.values[i] / spend[i] + 1.0),
+            "index": int(i),
+        })
+    return unfunded
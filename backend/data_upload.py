@@ -2,38 +2,240 @@
 Data Upload Handler - Process user-uploaded quarterly data for personalized calculations
 """
 import pandas as pd
-from typing import Dict, Any, Optional
+import numpy as np
+from typing import Dict, Any, Optional, List
 import io
+import re
 import json
+import threading
 from datetime import datetime
 
+# Columns summed when rolling rows up to departments/periods; everything else numeric is averaged
+SUM_COLUMNS = ['revenue', 'profit', 'costs', 'headcount', 'new_customers', 'marketing_spend', 'pipeline', 'deals_closed']
+MEAN_COLUMNS = ['cac', 'churn_rate', 'retention_rate', 'nps', 'csat', 'avg_deal_size']
+
+# Period columns in the order they identify a period
+PERIOD_COLUMNS = ['year', 'quarter', 'month']
+
+# Bucket for rows without a department (e.g. unallocated ledger lines); kept in company totals
+UNASSIGNED_DEPARTMENT = "(unassigned)"
+
+# Department/cost-center names recognised for each agent
+DEPARTMENT_AGENT_ALIASES = {
+    "Sales": ['sales', 'business development', 'bd', 'account management'],
+    "Marketing": ['marketing', 'growth', 'brand', 'demand generation'],
+    "Finance": ['finance', 'accounting', 'fp&a', 'treasury'],
+    "Operations": ['operations', 'ops', 'supply chain', 'logistics', 'facilities'],
+    "Support": ['support', 'customer support', 'customer success', 'customer service', 'service desk'],
+    "HR": ['hr', 'human resources', 'people', 'talent', 'recruiting'],
+}
+
+# Largest page of department x period records returned in one request
+MAX_DEPARTMENT_PERIOD_PAGE = 500
+
+# Typical share of workforce per function, used when no department data is uploaded
+DEFAULT_DEPARTMENT_SHARES = {
+    "Sales": 0.16,
+    "Marketing": 0.08,
+    "Finance": 0.06,
+    "Operations": 0.25,
+    "Support": 0.20,
+    "HR": 0.05,
+}
+
+# Typical share of operating costs per function; uploaded cost shares are compared against these
+DEFAULT_COST_SHARES = {
+    "Sales": 0.22,
+    "Marketing": 0.14,
+    "Finance": 0.07,
+    "Operations": 0.30,
+    "Support": 0.18,
+    "HR": 0.09,
+}
+
+class ProfileSnapshot:
+    """Derived state of one uploaded file; never mutated once published
+
+    Readers capture a snapshot once and use it throughout a calculation, so an upload
+    swapping in a new one cannot mix two files into a single result.
+    """
+    
+    def __init__(self, raw_data: Optional[pd.DataFrame] = None, metrics: Optional[Dict[str, Any]] = None,
+                 department_baselines: Optional[Dict[str, Dict[str, Any]]] = None,
+                 department_periods: Optional[List[Dict[str, Any]]] = None,
+                 version: int = 0, loaded_at: Optional[str] = None):
+        self.raw_data = raw_data if raw_data is not None else pd.DataFrame()
+        self.metrics = metrics or {}
+        self.department_baselines = department_baselines or {}
+        self.department_periods = department_periods or []
+        self.version = version
+        self.loaded_at = loaded_at
+        self.is_loaded = version > 0
+    
+    def get_department_headcount(self, agent_name: str) -> int:
+        """Actual department headcount, or the typical share of company headcount"""
+        department = self.department_baselines.get(agent_name, {})
+        if 'headcount' in department:
+            return department['headcount']
+        return int(self.metrics.get('current_headcount', 620) * DEFAULT_DEPARTMENT_SHARES.get(agent_name, 0.1))
+    
+    def get_baseline_for_agent(self, agent_name: str) -> Dict[str, Any]:
+        """Get baseline metrics for a specific agent"""
+        department = self.department_baselines.get(agent_name, {})
+        total_revenue = self.metrics.get('total_revenue', 10000000)
+        
+        baselines = {
+            "Sales": {
+                "current_pipeline": department.get('pipeline', self.metrics.get('current_pipeline', 2500000)),
+                "quarterly_deals": self.metrics.get('quarterly_deals', 45),
+                "avg_deal_size": department.get('avg_deal_size', self.metrics.get('avg_deal_size', 85000)),
+                "headcount": self.get_department_headcount("Sales"),
+            },
+            "Marketing": {
+                "current_cac": department.get('cac', self.metrics.get('avg_cac', 385)),
+                "marketing_spend": department.get('marketing_spend', department.get('costs', total_revenue * 0.12)),
+                "lead_volume": self.metrics.get('quarterly_deals', 45) * 5,  # 5:1 ratio
+            },
+            "Finance": {
+                "profit_margin": self.metrics.get('profit_margin', 15),
+                "total_revenue": total_revenue,
+                "operating_costs": self.metrics.get('total_costs', total_revenue - self.metrics.get('total_profit', 1500000)),
+            },
+            "Operations": {
+                "headcount": self.get_department_headcount("Operations"),
+                "csat": self.metrics.get('current_csat', 4.2),
+            },
+            "Support": {
+                "headcount": self.get_department_headcount("Support"),
+                "csat": department.get('csat', self.metrics.get('current_csat', 4.2)),
+                "nps": department.get('nps', self.metrics.get('current_nps', 42)),
+            },
+            "HR": {
+                "total_headcount": self.metrics.get('current_headcount', 620),
+                "churn_rate": self.metrics.get('current_churn', 0.08),
+                "revenue_per_employee": self.metrics.get('revenue_per_employee', 16000),
+            }
+        }
+        
+        baseline = baselines.get(agent_name, {})
+        if 'costs' in department:
+            baseline["department_costs"] = department['costs']
+        return baseline
+    
+    def adjust_calculations(self, base_values: Dict[str, Any], agent_name: str) -> Dict[str, Any]:
+        """Adjust base calculations using real company data"""
+        if not self.is_loaded:
+            return base_values
+        
+        department = self.department_baselines.get(agent_name, {})
+        default_share = DEFAULT_DEPARTMENT_SHARES.get(agent_name, 0.1)
+        adjusted = base_values.copy()
+        
+        # Scale budget impacts based on company size, then on the department's actual share of spend
+        budget_scale = 1.0
+        if 'total_revenue' in self.metrics:
+            budget_scale = self.metrics['total_revenue'] / 10000000  # Scale vs $10M baseline
+        if 'cost_share' in department:
+            budget_scale *= department['cost_share'] / department['expected_cost_share']
+        if budget_scale != 1.0:
+            adjusted['budgetImpact'] = round(base_values.get('budgetImpact', 0) * budget_scale)
+        
+        # Scale headcount based on the actual department (or company) workforce
+        if 'headcount' in department:
+            headcount_scale = department['headcount'] / (620 * default_share)  # Scale vs baseline department
+            adjusted['headcountImpact'] = round(base_values.get('headcountImpact', 0) * headcount_scale)
+        elif 'current_headcount' in self.metrics:
+            headcount_scale = self.metrics['current_headcount'] / 620  # Scale vs 620 baseline
+            adjusted['headcountImpact'] = round(base_values.get('headcountImpact', 0) * headcount_scale)
+        
+        # Adjust confidence based on data quality/trend
+        if 'profit_trend' in self.metrics:
+            if self.metrics['profit_trend'] == 'decreasing':
+                adjusted['confidence'] = max(50, adjusted.get('confidence', 85) - 10)
+            elif self.metrics['profit_trend'] == 'increasing':
+                adjusted['confidence'] = min(99, adjusted.get('confidence', 85) + 5)
+        
+        return adjusted
+
 class CompanyDataProfile:
     """Stores and processes uploaded company data"""
     
     def __init__(self):
-        self.raw_data = {}
-        self.metrics = {}
-        self.is_loaded = False
-        
+        self.snapshot = ProfileSnapshot()
+        # Serializes version numbering between concurrent uploads; readers never take it
+        self._swap_lock = threading.Lock()
+    
+    # Single-field views of the current snapshot; capture .snapshot to read several consistently
+    @property
+    def raw_data(self) -> pd.DataFrame:
+        return self.snapshot.raw_data
+    
+    @property
+    def metrics(self) -> Dict[str, Any]:
+        return self.snapshot.metrics
+    
+    @property
+    def department_baselines(self) -> Dict[str, Dict[str, Any]]:
+        return self.snapshot.department_baselines
+    
+    @property
+    def department_periods(self) -> List[Dict[str, Any]]:
+        return self.snapshot.department_periods
+    
+    @property
+    def is_loaded(self) -> bool:
+        return self.snapshot.is_loaded
+    
+    @property
+    def version(self) -> int:
+        return self.snapshot.version
+    
+    @property
+    def loaded_at(self) -> Optional[str]:
+        return self.snapshot.loaded_at
+    
+    def get_department_headcount(self, agent_name: str) -> int:
+        return self.snapshot.get_department_headcount(agent_name)
+    
+    def get_baseline_for_agent(self, agent_name: str) -> Dict[str, Any]:
+        return self.snapshot.get_baseline_for_agent(agent_name)
+    
+    def adjust_calculations(self, base_values: Dict[str, Any], agent_name: str) -> Dict[str, Any]:
+        return self.snapshot.adjust_calculations(base_values, agent_name)
+    
     def process_csv(self, file_content: bytes) -> Dict[str, Any]:
         """Process uploaded CSV/Excel file"""
         try:
-            # Try Excel first, then CSV
-            try:
+            # Excel workbooks (xlsx zip or legacy xls), otherwise CSV
+            if file_content[:2] == b"PK" or file_content[:4] == b"\xd0\xcf\x11\xe0":
                 df = pd.read_excel(io.BytesIO(file_content))
-            except:
-                df = pd.read_csv(io.BytesIO(file_content))
+            else:
+                df = self._read_csv(file_content)
             
             # Auto-detect column types and standardize
-            self.raw_data = self._standardize_columns(df)
-            self.metrics = self._calculate_metrics()
-            self.is_loaded = True
+            raw_data = self._standardize_columns(df)
+            
+            # One grouped pass over the rows: per-department, per-period aggregates
+            period_cols = [c for c in PERIOD_COLUMNS if c in raw_data]
+            department_periods = self._aggregate_departments(raw_data, period_cols)
+            
+            # Build the whole snapshot before publishing it with a single reference swap
+            metrics = self._calculate_metrics(self._period_frame(raw_data, department_periods, period_cols))
+            department_baselines = self._calculate_department_baselines(department_periods, period_cols)
+            department_period_records = self._department_period_records(department_periods)
+            
+            with self._swap_lock:
+                version = self.snapshot.version + 1
+                self.snapshot = ProfileSnapshot(raw_data, metrics, department_baselines, department_period_records,
+                                                version, datetime.now().isoformat())
             
             return {
                 "status": "success",
                 "message": f"Processed {len(df)} records",
-                "metrics": self.metrics,
-                "detected_columns": list(self.raw_data.keys())
+                "profile_version": version,
+                "metrics": metrics,
+                "detected_columns": list(raw_data.keys()),
+                "departments": department_baselines
             }
         except Exception as e:
             return {
@@ -41,13 +243,37 @@ class CompanyDataProfile:
                 "message": str(e)
             }
     
-    def _standardize_columns(self, df: pd.DataFrame) -> Dict[str, Any]:
+    def department_period_page(self, department: Optional[str] = None, offset: int = 0,
+                               limit: int = 100) -> Dict[str, Any]:
+        """Page of department x period records in department/period order (pass next_offset back as offset)"""
+        snapshot = self.snapshot
+        records, version = snapshot.department_periods, snapshot.version
+        if department is not None:
+            records = [r for r in records if r["department"] == department]
+        offset = max(0, offset)
+        limit = max(1, min(limit, MAX_DEPARTMENT_PERIOD_PAGE))
+        end = offset + limit
+        return {
+            "profile_version": version,
+            "total": len(records),
+            "items": records[offset:end],
+            "next_offset": end if end < len(records) else None,
+        }
+    
+    def _read_csv(self, file_content: bytes) -> pd.DataFrame:
+        """Parse CSV with the multithreaded pyarrow engine, falling back to the default parser"""
+        try:
+            return pd.read_csv(io.BytesIO(file_content), engine="pyarrow")
+        except Exception:
+            return pd.read_csv(io.BytesIO(file_content))
+    
+    def _standardize_columns(self, df: pd.DataFrame) -> pd.DataFrame:
         """Map various column names to standard fields"""
         column_mapping = {
             # Revenue/Sales
             'revenue': ['revenue', 'sales', 'turnover', 'gross_revenue', 'total_revenue'],
             'profit': ['profit', 'net_profit', 'operating_profit', 'ebitda', 'ebit', 'net_income'],
-            'costs': ['costs', 'expenses', 'total_costs', 'operating_costs', 'opex'],
+            'costs': ['costs', 'expenses', 'total_costs', 'operating_costs', 'opex', 'amount', 'spend'],
             'headcount': ['headcount', 'employees', 'fte', 'staff_count', 'workforce'],
             
             # CAC metrics
@@ -66,112 +292,248 @@ class CompanyDataProfile:
             'deals_closed': ['deals_closed', 'closed_deals', 'wins', 'sales_wins'],
             'avg_deal_size': ['avg_deal_size', 'deal_size', 'average_deal', 'contract_value'],
             
+            # Organisation
+            'department': ['department', 'dept', 'cost_center', 'cost_centre', 'business_unit', 'division', 'function'],
+            
             # Time period
-            'quarter': ['quarter', 'q', 'period', 'quarter_period'],
+            'quarter': ['quarter', 'q', 'period', 'quarter_period', 'fiscal_quarter'],
             'year': ['year', 'yr', 'fiscal_year'],
-            'month': ['month', 'mo', 'month_period'],
+            'month': ['month', 'mo', 'month_period', 'fiscal_month', 'posting_period'],
         }
         
-        standardized = {}
-        df_lower = {col.lower().replace(' ', '_'): col for col in df.columns}
+        selected = {}
+        df_lower = {str(col).lower().replace(' ', '_'): col for col in df.columns}
         
         for standard_name, possible_names in column_mapping.items():
             for possible in possible_names:
                 if possible in df_lower:
-                    original_col = df_lower[possible]
-                    standardized[standard_name] = df[original_col].tolist()
+                    selected[standard_name] = df_lower[possible]
                     break
         
         # If no standard columns found, use all columns as-is
-        if not standardized:
-            for col in df.columns:
-                standardized[col.lower().replace(' ', '_')] = df[col].tolist()
+        if not selected:
+            return df.rename(columns=lambda col: str(col).lower().replace(' ', '_'))
         
-        return standardized
+        # Coerce metric columns to numbers once, column-wise
+        return pd.DataFrame({
+            standard_name: pd.to_numeric(df[original_col], errors='coerce')
+            if standard_name in SUM_COLUMNS + MEAN_COLUMNS else df[original_col]
+            for standard_name, original_col in selected.items()
+        })
     
-    def _calculate_metrics(self) -> Dict[str, Any]:
-        """Calculate key metrics from raw data"""
+    def _aggregate_departments(self, data: pd.DataFrame, period_cols: List[str]) -> Optional[pd.DataFrame]:
+        """Sum/average metrics per department and period in a single group-by"""
+        if 'department' not in data:
+            return None
+        
+        sum_cols = [c for c in SUM_COLUMNS if c in data]
+        mean_cols = [c for c in MEAN_COLUMNS if c in data]
+        if not sum_cols and not mean_cols:
+            return None
+        
+        departments = data['department']
+        blank = departments.isna() | (departments.astype(str).str.strip() == '')
+        departments = departments.where(~blank, UNASSIGNED_DEPARTMENT).astype('category')
+        keys = [departments] + [data[c] for c in period_cols]
+        # dropna=False: rows with a blank period still count towards the company rollup
+        grouped = data[sum_cols + mean_cols].groupby(keys, sort=False, observed=True, dropna=False)
+        
+        parts = []
+        if sum_cols:
+            parts.append(grouped[sum_cols].sum(min_count=1))
+        if mean_cols:
+            parts.append(grouped[mean_cols].mean())
+        return pd.concat(parts, axis=1) if len(parts) > 1 else parts[0]
+    
+    def _rollup(self, frame: pd.DataFrame, level) -> pd.DataFrame:
+        """Combine grouped rows: sums add up, rates average"""
+        sum_cols = [c for c in SUM_COLUMNS if c in frame]
+        mean_cols = [c for c in MEAN_COLUMNS if c in frame]
+        grouped = frame.groupby(level=level, sort=True, observed=True, dropna=False)
+        
+        parts = []
+        if sum_cols:
+            parts.append(grouped[sum_cols].sum(min_count=1))
+        if mean_cols:
+            parts.append(grouped[mean_cols].mean())
+        return pd.concat(parts, axis=1) if len(parts) > 1 else parts[0]
+    
+    def _period_frame(self, data: pd.DataFrame, department_periods: Optional[pd.DataFrame],
+                      period_cols: List[str]) -> pd.DataFrame:
+        """Company-level rows, one per period (sorted by period when rows are grouped)"""
+        if department_periods is not None:
+            if period_cols:
+                return self._rollup(department_periods, period_cols)
+            # No period columns: the whole upload is a single period
+            return self._rollup(department_periods.assign(_all=0).set_index('_all', append=True), '_all')
+        
+        if period_cols and data.duplicated(subset=period_cols).any():
+            # Ledger-style extract: many rows per period
+            return self._rollup(data.set_index(period_cols), period_cols)
+        
+        # Summary upload: each row is already one period
+        return data
+    
+    def _calculate_metrics(self, data: pd.DataFrame) -> Dict[str, Any]:
+        """Calculate key metrics from period-level data"""
         metrics = {}
         
+        def values(col: str) -> np.ndarray:
+            return pd.to_numeric(data[col], errors='coerce').dropna().to_numpy(dtype=float)
+        
         # Revenue metrics
-        if 'revenue' in self.raw_data:
-            revenues = [float(x) for x in self.raw_data['revenue'] if pd.notna(x)]
-            metrics['total_revenue'] = sum(revenues)
-            metrics['avg_quarterly_revenue'] = sum(revenues) / len(revenues) if revenues else 0
+        if 'revenue' in data:
+            revenues = values('revenue')
+            metrics['total_revenue'] = float(revenues.sum())
+            metrics['avg_quarterly_revenue'] = float(revenues.mean()) if len(revenues) else 0
             metrics['revenue_trend'] = self._calculate_trend(revenues)
         
         # Profit metrics
-        if 'profit' in self.raw_data:
-            profits = [float(x) for x in self.raw_data['profit'] if pd.notna(x)]
-            metrics['total_profit'] = sum(profits)
-            metrics['profit_margin'] = (sum(profits) / metrics['total_revenue'] * 100) if metrics.get('total_revenue') else 0
+        if 'profit' in data:
+            profits = values('profit')
+            metrics['total_profit'] = float(profits.sum())
+            metrics['profit_margin'] = (float(profits.sum()) / metrics['total_revenue'] * 100) if metrics.get('total_revenue') else 0
             metrics['profit_trend'] = self._calculate_trend(profits)
         
+        # Cost metrics
+        if 'costs' in data:
+            costs = values('costs')
+            metrics['total_costs'] = float(costs.sum())
+            metrics['cost_trend'] = self._calculate_trend(costs)
+        
         # CAC metrics
-        if 'cac' in self.raw_data:
-            cacs = [float(x) for x in self.raw_data['cac'] if pd.notna(x)]
-            metrics['avg_cac'] = sum(cacs) / len(cacs) if cacs else 385  # Default fallback
+        if 'cac' in data:
+            cacs = values('cac')
+            metrics['avg_cac'] = float(cacs.mean()) if len(cacs) else 385  # Default fallback
             metrics['cac_trend'] = self._calculate_trend(cacs)
-        elif 'marketing_spend' in self.raw_data and 'new_customers' in self.raw_data:
-            marketing = sum([float(x) for x in self.raw_data['marketing_spend'] if pd.notna(x)])
-            customers = sum([float(x) for x in self.raw_data['new_customers'] if pd.notna(x)])
+        elif 'marketing_spend' in data and 'new_customers' in data:
+            marketing = float(values('marketing_spend').sum())
+            customers = float(values('new_customers').sum())
             metrics['avg_cac'] = marketing / customers if customers > 0 else 385
         
         # Headcount
-        if 'headcount' in self.raw_data:
-            headcounts = [int(x) for x in self.raw_data['headcount'] if pd.notna(x)]
-            metrics['current_headcount'] = headcounts[-1] if headcounts else 620
-            metrics['headcount_change'] = (headcounts[-1] - headcounts[0]) if len(headcounts) > 1 else 0
+        if 'headcount' in data:
+            headcounts = values('headcount')
+            metrics['current_headcount'] = int(headcounts[-1]) if len(headcounts) else 620
+            metrics['headcount_change'] = int(headcounts[-1] - headcounts[0]) if len(headcounts) > 1 else 0
         else:
             metrics['current_headcount'] = 620  # Default
         
         # Churn/Retention
-        if 'churn_rate' in self.raw_data:
-            churns = [float(x) for x in self.raw_data['churn_rate'] if pd.notna(x)]
-            metrics['current_churn'] = churns[-1] if churns else 0.08
-            metrics['avg_churn'] = sum(churns) / len(churns) if churns else 0.08
-        elif 'retention_rate' in self.raw_data:
-            retentions = [float(x) for x in self.raw_data['retention_rate'] if pd.notna(x)]
-            metrics['current_churn'] = 1 - (retentions[-1] / 100) if retentions else 0.08
+        if 'churn_rate' in data:
+            churns = values('churn_rate')
+            metrics['current_churn'] = float(churns[-1]) if len(churns) else 0.08
+            metrics['avg_churn'] = float(churns.mean()) if len(churns) else 0.08
+        elif 'retention_rate' in data:
+            retentions = values('retention_rate')
+            metrics['current_churn'] = 1 - (float(retentions[-1]) / 100) if len(retentions) else 0.08
         else:
             metrics['current_churn'] = 0.08
         
         # Sales pipeline
-        if 'pipeline' in self.raw_data:
-            pipelines = [float(x) for x in self.raw_data['pipeline'] if pd.notna(x)]
-            metrics['current_pipeline'] = pipelines[-1] if pipelines else 2500000
+        if 'pipeline' in data:
+            pipelines = values('pipeline')
+            metrics['current_pipeline'] = float(pipelines[-1]) if len(pipelines) else 2500000
         
         # Deal metrics
-        if 'deals_closed' in self.raw_data:
-            deals = [int(x) for x in self.raw_data['deals_closed'] if pd.notna(x)]
-            metrics['quarterly_deals'] = deals[-1] if deals else 45
+        if 'deals_closed' in data:
+            deals = values('deals_closed')
+            metrics['quarterly_deals'] = int(deals[-1]) if len(deals) else 45
         
-        if 'avg_deal_size' in self.raw_data:
-            deal_sizes = [float(x) for x in self.raw_data['avg_deal_size'] if pd.notna(x)]
-            metrics['avg_deal_size'] = sum(deal_sizes) / len(deal_sizes) if deal_sizes else 85000
+        if 'avg_deal_size' in data:
+            deal_sizes = values('avg_deal_size')
+            metrics['avg_deal_size'] = float(deal_sizes.mean()) if len(deal_sizes) else 85000
         
         # NPS/CSAT
-        if 'nps' in self.raw_data:
-            nps_scores = [float(x) for x in self.raw_data['nps'] if pd.notna(x)]
-            metrics['current_nps'] = nps_scores[-1] if nps_scores else 42
+        if 'nps' in data:
+            nps_scores = values('nps')
+            metrics['current_nps'] = float(nps_scores[-1]) if len(nps_scores) else 42
         
-        if 'csat' in self.raw_data:
-            csat_scores = [float(x) for x in self.raw_data['csat'] if pd.notna(x)]
-            metrics['current_csat'] = csat_scores[-1] if csat_scores else 4.2
+        if 'csat' in data:
+            csat_scores = values('csat')
+            metrics['current_csat'] = float(csat_scores[-1]) if len(csat_scores) else 4.2
         
         # Calculated metrics
-        if 'total_revenue' in metrics and 'current_headcount' in metrics:
+        if 'total_revenue' in metrics and metrics.get('current_headcount'):
             metrics['revenue_per_employee'] = metrics['total_revenue'] / metrics['current_headcount']
         
         return metrics
     
-    def _calculate_trend(self, values: list) -> str:
+    def _match_agent(self, department: Any) -> Optional[str]:
+        """Map a department/cost-center name to the agent that owns it"""
+        name = re.sub(r'[_\-/]+', ' ', str(department).strip().lower())
+        for agent_name, aliases in DEPARTMENT_AGENT_ALIASES.items():
+            for alias in aliases:
+                if re.search(rf'\b{re.escape(alias)}\b', name):
+                    return agent_name
+        return None
+    
+    def _calculate_department_baselines(self, department_periods: Optional[pd.DataFrame],
+                                        period_cols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Per-agent baselines from the department aggregates (departments rolled up per agent)"""
+        if department_periods is None or department_periods.empty:
+            return {}
+        
+        departments = department_periods.index.get_level_values(0)
+        agent_map = {dept: self._match_agent(dept) for dept in departments.unique()}
+        agents = departments.map(agent_map)
+        matched = department_periods[agents.notna()]
+        if matched.empty:
+            return {}
+        
+        agent_keys = [agents[agents.notna()].rename('agent')] + \
+            [matched.index.get_level_values(c) for c in period_cols]
+        agent_periods = self._rollup(matched.set_index(agent_keys), ['agent'] + period_cols)
+        
+        baselines = {}
+        for agent_name, rows in agent_periods.groupby(level='agent', sort=False):
+            baseline = {
+                "departments": sorted(str(d) for d, a in agent_map.items() if a == agent_name),
+                "periods": len(rows),
+            }
+            if 'headcount' in rows:
+                headcounts = rows['headcount'].dropna()
+                if len(headcounts):
+                    baseline["headcount"] = int(headcounts.iloc[-1])
+            for col in ['revenue', 'costs', 'marketing_spend', 'pipeline', 'deals_closed', 'new_customers']:
+                if col in rows and rows[col].notna().any():
+                    baseline[col] = float(rows[col].sum())
+            for col in MEAN_COLUMNS:
+                if col in rows and rows[col].notna().any():
+                    baseline[col] = float(rows[col].mean())
+            if 'costs' in rows:
+                baseline["cost_trend"] = self._calculate_trend(rows['costs'].dropna().to_numpy(dtype=float))
+            baselines[agent_name] = baseline
+        
+        # Cost shares only cover the agents with cost data, so compare them against the
+        # typical shares renormalized over those same agents
+        with_costs = [name for name, b in baselines.items() if b.get("costs", 0) > 0]
+        total_costs = sum(baselines[name]["costs"] for name in with_costs)
+        total_default = sum(DEFAULT_COST_SHARES.get(name, 0.1) for name in with_costs)
+        for name in with_costs:
+            baselines[name]["cost_share"] = baselines[name]["costs"] / total_costs
+            baselines[name]["expected_cost_share"] = DEFAULT_COST_SHARES.get(name, 0.1) / total_default
+        
+        return baselines
+    
+    def _department_period_records(self, department_periods: Optional[pd.DataFrame]) -> List[Dict[str, Any]]:
+        """Department x period aggregates as JSON-ready records"""
+        if department_periods is None:
+            return []
+        records = department_periods.sort_index().reset_index()
+        records = records.astype(object).where(records.notna(), None)
+        return [{k: (str(v) if k in ['department'] + PERIOD_COLUMNS and v is not None else v)
+                 for k, v in row.items()} for row in records.to_dict(orient='records')]
+    
+    def _calculate_trend(self, values) -> str:
         """Calculate if trend is up, down, or flat"""
+        values = np.asarray(values, dtype=float)
         if len(values) < 2:
             return "stable"
         
-        first_half = sum(values[:len(values)//2]) / (len(values)//2) if values else 0
-        second_half = sum(values[len(values)//2:]) / (len(values) - len(values)//2) if values else 0
+        half = len(values) // 2
+        first_half = values[:half].mean()
+        second_half = values[half:].mean()
         
         change_pct = ((second_half - first_half) / first_half * 100) if first_half else 0
         
@@ -180,70 +542,6 @@ class CompanyDataProfile:
         elif change_pct < -5:
             return "decreasing"
         return "stable"
-    
-    def get_baseline_for_agent(self, agent_name: str) -> Dict[str, Any]:
-        """Get baseline metrics for a specific agent"""
-        baselines = {
-            "Sales": {
-                "current_pipeline": self.metrics.get('current_pipeline', 2500000),
-                "quarterly_deals": self.metrics.get('quarterly_deals', 45),
-                "avg_deal_size": self.metrics.get('avg_deal_size', 85000),
-                "headcount": int(self.metrics.get('current_headcount', 620) * 0.16),  # ~16% of workforce
-            },
-            "Marketing": {
-                "current_cac": self.metrics.get('avg_cac', 385),
-                "marketing_spend": self.metrics.get('total_revenue', 10000000) * 0.12,  # ~12% of revenue
-                "lead_volume": self.metrics.get('quarterly_deals', 45) * 5,  # 5:1 ratio
-            },
-            "Finance": {
-                "profit_margin": self.metrics.get('profit_margin', 15),
-                "total_revenue": self.metrics.get('total_revenue', 10000000),
-                "operating_costs": self.metrics.get('total_revenue', 10000000) - self.metrics.get('total_profit', 1500000),
-            },
-            "Operations": {
-                "headcount": int(self.metrics.get('current_headcount', 620) * 0.25),  # ~25% of workforce
-                "csat": self.metrics.get('current_csat', 4.2),
-            },
-            "Support": {
-                "headcount": int(self.metrics.get('current_headcount', 620) * 0.20),  # ~20% of workforce
-                "csat": self.metrics.get('current_csat', 4.2),
-                "nps": self.metrics.get('current_nps', 42),
-            },
-            "HR": {
-                "total_headcount": self.metrics.get('current_headcount', 620),
-                "churn_rate": self.metrics.get('current_churn', 0.08),
-                "revenue_per_employee": self.metrics.get('revenue_per_employee', 16000),
-            }
-        }
-        
-        return baselines.get(agent_name, {})
-    
-    def adjust_calculations(self, base_values: Dict[str, Any], agent_name: str) -> Dict[str, Any]:
-        """Adjust base calculations using real company data"""
-        if not self.is_loaded:
-            return base_values
-        
-        agent_baseline = self.get_baseline_for_agent(agent_name)
-        adjusted = base_values.copy()
-        
-        # Scale budget impacts based on company size
-        if 'total_revenue' in self.metrics:
-            revenue_scale = self.metrics['total_revenue'] / 10000000  # Scale vs $10M baseline
-            adjusted['budgetImpact'] = round(base_values.get('budgetImpact', 0) * revenue_scale)
-        
-        # Scale headcount based on actual workforce
-        if 'current_headcount' in self.metrics:
-            headcount_scale = self.metrics['current_headcount'] / 620  # Scale vs 620 baseline
-            adjusted['headcountImpact'] = round(base_values.get('headcountImpact', 0) * headcount_scale)
-        
-        # Adjust confidence based on data quality/trend
-        if 'profit_trend' in self.metrics:
-            if self.metrics['profit_trend'] == 'decreasing':
-                adjusted['confidence'] = max(50, adjusted.get('confidence', 85) - 10)
-            elif self.metrics['profit_trend'] == 'increasing':
-                adjusted['confidence'] = min(99, adjusted.get('confidence', 85) + 5)
-        
-        return adjusted
 
 # Global instance to store uploaded data
 company_profile = CompanyDataProfile()
@@ -0,0 +1,184 @@
+"""
+Live Updates - Push channel for dashboards (SSE and WebSocket fan-out)
+"""
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, AsyncIterator
+
+# Per-subscriber buffer; a consumer this far behind only needs the newest state
+SUBSCRIBER_QUEUE_SIZE = 64
+
+# A consumer that overflows this many times in a row is disconnected
+MAX_CONSECUTIVE_DROPS = 256
+
+# Keepalive (SSE comment / WebSocket no-op frame) sent when idle so proxies keep the connection open
+KEEPALIVE_SECONDS = 15
+WEBSOCKET_KEEPALIVE_FRAME = json.dumps({"type": "keepalive"})
+
+# Tenants whose latest scoped events are kept for replay to new subscribers
+MAX_REPLAY_TENANTS = 1024
+
+
+class Subscriber:
+    """One connected dashboard with its own bounded outbound queue"""
+
+    def __init__(self, subscriber_id: int, tenant: str):
+        self.id = subscriber_id
+        self.tenant = tenant
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.dropped = 0
+        self.consecutive_drops = 0
+        self.closed = False
+
+    def offer(self, frame: str) -> bool:
+        """Enqueue a pre-serialized frame, shedding the oldest one if the consumer is slow"""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(frame)
+            self.consecutive_drops = 0
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        # Slow consumer: drop the oldest frame so the newest state always gets through
+        try:
+            self.queue.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+        self.queue.put_nowait(frame)
+        self.dropped += 1
+        self.consecutive_drops += 1
+        return self.consecutive_drops < MAX_CONSECUTIVE_DROPS
+
+    async def next_frame(self, timeout: float = KEEPALIVE_SECONDS) -> Optional[str]:
+        """Wait for the next frame; returns None on timeout so callers can check for closure"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBroadcaster:
+    """Serializes each event once and fans the frame out to every subscriber
+
+    Events published with a tenant (calculations) only reach that tenant's
+    subscribers; events without one (the shared company profile) reach everyone.
+    """
+
+    def __init__(self):
+        self.subscribers: Dict[int, Subscriber] = {}
+        self.sequence = 0
+        self.last_events: Dict[str, str] = {}
+        self.last_tenant_events: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+        self._next_id = 0
+
+    def subscribe(self, tenant: str) -> Subscriber:
+        """Register a new subscriber and replay the latest event of each type it may see"""
+        self._next_id += 1
+        subscriber = Subscriber(self._next_id, tenant)
+        for frame in self.last_events.values():
+            subscriber.offer(frame)
+        for frame in self.last_tenant_events.get(tenant, {}).values():
+            subscriber.offer(frame)
+        self.subscribers[subscriber.id] = subscriber
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscriber.closed = True
+        self.subscribers.pop(subscriber.id, None)
+
+    def publish(self, event_type: str, payload: Dict[str, Any], tenant: Optional[str] = None) -> int:
+        """Broadcast an event (to one tenant's subscribers if given); returns the number that received it"""
+        self.sequence += 1
+        frame = json.dumps({
+            "seq": self.sequence,
+            "type": event_type,
+            "ts": time.time(),
+            "data": payload,
+        }, default=str)
+        if tenant is None:
+            self.last_events[event_type] = frame
+        else:
+            self.last_tenant_events.setdefault(tenant, {})[event_type] = frame
+            self.last_tenant_events.move_to_end(tenant)
+            if len(self.last_tenant_events) > MAX_REPLAY_TENANTS:
+                self.last_tenant_events.popitem(last=False)
+
+        delivered = 0
+        for subscriber in list(self.subscribers.values()):
+            if tenant is not None and subscriber.tenant != tenant:
+                continue
+            if subscriber.offer(frame):
+                delivered += 1
+            else:
+                print(f"Dropping slow subscriber {subscriber.id} after {subscriber.dropped} missed events")
+                self.unsubscribe(subscriber)
+        return delivered
+
+    async def sse_stream(self, subscriber: Subscriber) -> AsyncIterator[str]:
+        """Yield Server-Sent Events frames for a subscriber until it disconnects"""
+        try:
+            while not subscriber.closed:
+                frame = await subscriber.next_frame()
+                if frame is None:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {frame}\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+    async def websocket_stream(self, subscriber: Subscriber, websocket: Any):
+        """Send frames over an accepted WebSocket until either side closes it
+
+        A receive task runs alongside the send loop so a client closing an idle
+        connection is unsubscribed immediately rather than on the next failed send.
+        """
+        async def wait_for_disconnect():
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+
+        receiver = asyncio.create_task(wait_for_disconnect())
+        try:
+            while not subscriber.closed:
+                sender = asyncio.create_task(subscriber.next_frame())
+                done, _ = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+                if receiver in done:
+                    sender.cancel()
+                    break
+                frame = sender.result()
+                await websocket.send_text(frame if frame is not None else WEBSOCKET_KEEPALIVE_FRAME)
+        except Exception:
+            # Send failures surface as server-specific disconnect errors; the client is gone either way
+            pass
+        finally:
+            receiver.cancel()
+            self.unsubscribe(subscriber)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len(self.subscribers),
+            "events_published": self.sequence,
+            "dropped_frames": sum(s.dropped for s in self.subscribers.values()),
+        }
+
+
+def scenario_summary(result: Any, prompt: Optional[str] = None) -> Dict[str, Any]:
+    """Compact summary of a calculation result for broadcasting (agents/charts omitted)"""
+    return {
+        "prompt": prompt,
+        "profitGrowth": result.profitGrowth,
+        "ctcReduction": result.ctcReduction,
+        "overallConfidence": result.overallConfidence,
+        "totalSavings": result.totalSavings,
+        "totalHeadcountChange": result.totalHeadcountChange,
+        "conflictCount": len(result.conflicts),
+    }
+
+
+# Global instance shared by all endpoints
+broadcaster = EventBroadcaster()
@@ -3,23 +3,52 @@ FastAPI Backend for Agentic Enterprise Web Interface
 Uses Gemini API for intelligent CEO prompt parsing and dynamic calculations
 """
 
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, WebSocket, Header
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Dict, List, Any, Optional
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Dict, List, Any, Optional, Literal
 import os
 import sys
+import asyncio
 import re
-import json
 
 # Add parent directory to path to import existing modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Import data upload handler
-from data_upload import company_profile
+from data_upload import company_profile, ProfileSnapshot
+
+# Import allocation solver used for conflict resolution
+from conflict_optimizer import optimize_allocation, find_conflicts, find_unfunded, ALLOCATION_EPS
+
+# Import push channel for live dashboard updates
+from live_updates import broadcaster, scenario_summary
+
+# Import append-only scenario history store
+from scenario_history import scenario_history
+
+# Import precomputed scenario table
+from scenario_table import scenario_table, COMMON_TIMELINES
+
+# Import admission control for load shedding
+from admission import admission, AdmissionMiddleware
 
 app = FastAPI(title="Agentic Enterprise API", version="2.0.0")
 
+# Admission lanes: LLM-bound and upload work get bounded concurrency and queues;
+# health checks, live-update channels and other cheap reads bypass admission
+admission.add_lane("llm", max_concurrency=int(os.getenv("CALCULATE_MAX_CONCURRENCY", "8")), max_queue=32, queue_timeout=5.0)
+admission.add_lane("upload", max_concurrency=2, max_queue=4, queue_timeout=10.0)
+admission.add_lane("history", max_concurrency=16, max_queue=64, queue_timeout=2.0)
+admission.route("POST /api/calculate", "llm")
+admission.route("POST /api/upload", "upload")
+admission.route("GET /api/scenarios/export", "history")
+
+# Added before CORS so rejected requests still carry CORS headers
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
 # CORS for frontend
 app.add_middleware(
     CORSMiddleware,
@@ -31,11 +60,57 @@ app.add_middleware(
 
 # Gemini API Key - Set via environment variable
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+
+# Sent once as the model's system instruction instead of being prepended to every prompt
+INTENT_SYSTEM_INSTRUCTION = (
+    "Extract structured intent from the CEO directive. Percentages are plain numbers "
+    "(15 for 15%). Use null when a field does not apply."
+)
+
+# Schema-constrained output keeps the response to the intent fields only
+INTENT_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "primary_objective": {"type": "STRING", "description": "main goal (profit increase, cost reduction, etc.)"},
+        "secondary_objective": {"type": "STRING", "nullable": True, "description": "secondary goal"},
+        "target_percentage": {"type": "NUMBER", "description": "e.g. 15 for 15%"},
+        "secondary_percentage": {"type": "NUMBER", "nullable": True, "description": "percentage for the secondary goal"},
+        "objective_type": {"type": "STRING", "enum": ["profit", "cost_reduction", "growth", "efficiency", "revenue"]},
+        "time_horizon": {"type": "STRING", "enum": ["short", "medium", "long"]},
+        "urgency_level": {"type": "STRING", "enum": ["low", "medium", "high"]},
+        "budget_implication": {"type": "STRING", "enum": ["cut_costs", "invest", "reallocate", "maintain"]},
+        "inherent_tension": {"type": "STRING", "nullable": True, "description": "description of conflicting objectives"},
+        "affected_departments": {"type": "ARRAY", "items": {"type": "STRING"},
+                                 "description": "departments involved: Sales, Marketing, Finance, Operations, Support, HR"}
+    },
+    "required": ["primary_objective", "target_percentage", "objective_type", "time_horizon",
+                 "urgency_level", "budget_implication", "affected_departments"]
+}
+
+INTENT_MAX_OUTPUT_TOKENS = 256
+
+_gemini_model = None
+
+# Running token totals across all Gemini requests
+gemini_usage = {"requests": 0, "prompt_tokens": 0, "output_tokens": 0, "cached_tokens": 0}
+
+class ParsedIntent(BaseModel):
+    primary_objective: str
+    secondary_objective: Optional[str] = None
+    target_percentage: float = 15
+    secondary_percentage: Optional[float] = None
+    objective_type: Literal["profit", "cost_reduction", "growth", "efficiency", "revenue"] = "efficiency"
+    time_horizon: Literal["short", "medium", "long"] = "medium"
+    urgency_level: Literal["low", "medium", "high"] = "medium"
+    budget_implication: Literal["cut_costs", "invest", "reallocate", "maintain"] = "reallocate"
+    inherent_tension: Optional[str] = None
+    affected_departments: List[str] = []
 
 class CEOPrompt(BaseModel):
     prompt: str
     investment_limit: Optional[float] = None
-    timeline_weeks: Optional[int] = None
+    timeline_weeks: Optional[int] = Field(None, ge=1, le=520)
 
 class AgentDecision(BaseModel):
     name: str
@@ -68,6 +143,9 @@ class ConflictData(BaseModel):
     agents: List[str]
     savingsImpact: float
 
+# Share of the workforce that may be cut within one plan, by urgency
+HEADCOUNT_REDUCTION_LIMITS = {"low": 0.01, "medium": 0.02, "high": 0.03}
+
 # Agent configurations with dynamic calculation factors
 AGENT_CONFIGS = {
     "Sales": {
@@ -138,43 +216,53 @@ AGENT_CONFIGS = {
     }
 }
 
-async def parse_with_gemini(prompt: str) -> Dict[str, Any]:
-    """Use Gemini to parse CEO intent intelligently"""
-    try:
+def get_gemini_model():
+    """Build the Gemini model once; the system instruction and JSON schema are reused across requests"""
+    global _gemini_model
+    if _gemini_model is None:
         import google.generativeai as genai
         genai.configure(api_key=GEMINI_API_KEY)
-        
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
-        system_prompt = """You are an enterprise AI parser. Extract structured intent from CEO directives.
-        
-Analyze this CEO prompt and return a JSON object with:
-{
-    "primary_objective": "main goal (profit increase, cost reduction, etc.)",
-    "secondary_objective": "secondary goal or null",
-    "target_percentage": number (e.g., 15 for 15%),
-    "secondary_percentage": number or null,
-    "objective_type": "profit" | "cost_reduction" | "growth" | "efficiency" | "revenue",
-    "time_horizon": "short" | "medium" | "long",
-    "urgency_level": "low" | "medium" | "high",
-    "budget_implication": "cut_costs" | "invest" | "reallocate" | "maintain",
-    "inherent_tension": "description of conflicting objectives or null",
-    "affected_departments": ["list", "of", "departments"]
-}
+        _gemini_model = genai.GenerativeModel(
+            GEMINI_MODEL,
+            system_instruction=INTENT_SYSTEM_INSTRUCTION,
+            generation_config=genai.GenerationConfig(
+                response_mime_type="application/json",
+                response_schema=INTENT_RESPONSE_SCHEMA,
+                max_output_tokens=INTENT_MAX_OUTPUT_TOKENS,
+                temperature=0
+            )
+        )
+    return _gemini_model
 
-CEO Prompt: """ + prompt
-        
-        response = model.generate_content(system_prompt)
+def record_token_usage(response) -> Dict[str, int]:
+    """Extract per-request token counts and add them to the running totals"""
+    usage = getattr(response, "usage_metadata", None)
+    counts = {
+        "prompt_tokens": getattr(usage, "prompt_token_count", 0) or 0,
+        "output_tokens": getattr(usage, "candidates_token_count", 0) or 0,
+        "cached_tokens": getattr(usage, "cached_content_token_count", 0) or 0,
+    }
+    gemini_usage["requests"] += 1
+    for key, value in counts.items():
+        gemini_usage[key] += value
+    return counts
+
+async def parse_with_gemini(prompt: str) -> Dict[str, Any]:
+    """Use Gemini to parse CEO intent intelligently"""
+    if not GEMINI_API_KEY:
+        return parse_ceo_intent_fallback(prompt)
+    
+    try:
+        model = get_gemini_model()
         
-        # Extract JSON from response
-        text = response.text
-        # Find JSON block
-        json_match = re.search(r'\{.*\}', text, re.DOTALL)
-        if json_match:
-            return json.loads(json_match.group())
+        # Run the blocking SDK call off the event loop so cheap routes stay responsive
+        response = await run_in_threadpool(model.generate_content, prompt)
+        token_usage = record_token_usage(response)
         
-        # Fallback to regex parsing
-        return parse_ceo_intent_fallback(prompt)
+        # Schema-constrained output parses straight into the typed intent
+        parsed = ParsedIntent.model_validate_json(response.text).model_dump()
+        parsed["token_usage"] = token_usage
+        return parsed
         
     except Exception as e:
         print(f"Gemini error: {e}")
@@ -238,12 +326,56 @@ def parse_ceo_intent_fallback(prompt: str) -> Dict[str, Any]:
     
     return result
 
-def calculate_agent_decisions(parsed: Dict[str, Any], investment: float, timeline: int) -> List[AgentDecision]:
+def get_base_investment(profile: ProfileSnapshot) -> float:
+    """Reference investment the agent budgets are calibrated against"""
+    if profile.is_loaded and 'total_revenue' in profile.metrics:
+        # Scale base investment to ~6.2% of annual revenue (typical optimization budget)
+        return profile.metrics['total_revenue'] * 0.062
+    return 620000
+
+def get_timeline_factor(timeline: int) -> float:
+    """Timeline factor (0.6 to 1.0)"""
+    return min(1.0, max(0.6, timeline / 12))
+
+def decision_terms(budget_impl: str, target_pct: float) -> Dict[str, Any]:
+    """Wording and figures substituted into agent decision and trigger templates"""
+    if budget_impl == "cut_costs":
+        return {
+            "action": "Freeze",
+            "reverse_action": "2 SDR hires",
+            "percentage": int(target_pct * 0.8),
+            "number": max(2, int(target_pct / 5)),
+            "margin": round(target_pct * 0.15, 1)
+        }
+    if budget_impl == "invest":
+        return {
+            "action": "Accelerate",
+            "reverse_action": "freeze",
+            "percentage": int(target_pct * 1.2),
+            "number": max(1, int(target_pct / 10)),
+            "margin": round(target_pct * 0.2, 1)
+        }
+    # Mixed or reallocate
+    return {
+        "action": "Optimize",
+        "reverse_action": "current pace",
+        "percentage": int(target_pct),
+        "number": max(2, int(target_pct / 7)),
+        "margin": round(target_pct * 0.17, 1)
+    }
+
+def format_agent_text(name: str, terms: Dict[str, Any]) -> tuple:
+    """Render an agent's decision and trigger text"""
+    config = AGENT_CONFIGS[name]
+    decision = config["base_decision"].format(**terms)
+    trigger = config["trigger"].format(reverse_action=terms["reverse_action"].lower())
+    return decision, trigger
+
+def calculate_agent_decisions(parsed: Dict[str, Any], investment: float, timeline: int,
+                              profile: ProfileSnapshot) -> List[AgentDecision]:
     """Calculate dynamic agent decisions based on parsed intent and real company data"""
     
-    obj_type = parsed.get("objective_type", "efficiency")
     target_pct = parsed.get("target_percentage", 15)
-    secondary_pct = parsed.get("secondary_percentage")
     budget_impl = parsed.get("budget_implication", "reallocate")
     urgency = parsed.get("urgency_level", "medium")
     
@@ -251,72 +383,46 @@ def calculate_agent_decisions(parsed: Dict[str, Any], investment: float, timelin
     is_cost_cutting = budget_impl == "cut_costs"
     is_investing = budget_impl == "invest"
     
-    # Timeline factor (0.6 to 1.0)
-    timeline_factor = min(1.0, max(0.6, timeline / 12))
-    
-    # Use company data for baseline if available
-    if company_profile.is_loaded and 'total_revenue' in company_profile.metrics:
-        base_revenue = company_profile.metrics['total_revenue']
-        # Scale base investment to ~6.2% of annual revenue (typical optimization budget)
-        base_investment = base_revenue * 0.062
-        print(f"Using company baseline: Revenue=${base_revenue:,.0f}, Investment=${base_investment:,.0f}")
-    else:
-        base_investment = 620000
-        print(f"Using default baseline: Investment=${base_investment:,.0f}")
+    timeline_factor = get_timeline_factor(timeline)
     
     # Investment factor (scales with budget)
-    investment_factor = (investment / base_investment) ** 0.8
+    investment_factor = (investment / get_base_investment(profile)) ** 0.8
     
     # Urgency factor
     urgency_multiplier = 1.2 if urgency == "high" else 1.0 if urgency == "medium" else 0.9
     
+    terms = decision_terms(budget_impl, target_pct)
     agents = []
     
     for name, config in AGENT_CONFIGS.items():
         # Determine if this agent should show positive or negative budget
         if is_cost_cutting:
             base_budget = config["base_budget_positive"]
-            action = "Freeze"
-            reverse_action = "2 SDR hires"
-            percentage = int(target_pct * 0.8)
-            number = max(2, int(target_pct / 5))
-            margin = round(target_pct * 0.15, 1)
         elif is_investing:
             base_budget = config["base_budget_negative"]
-            action = "Accelerate"
-            reverse_action = "freeze"
-            percentage = int(target_pct * 1.2)
-            number = max(1, int(target_pct / 10))
-            margin = round(target_pct * 0.2, 1)
         else:
-            # Mixed or reallocate
             base_budget = config["base_budget_positive"] if name in ["Sales", "HR", "Operations"] else config["base_budget_negative"]
-            action = "Optimize"
-            reverse_action = "current pace"
-            percentage = int(target_pct)
-            number = max(2, int(target_pct / 7))
-            margin = round(target_pct * 0.17, 1)
         
-        # Scale budget by investment factor and company size
+        # Scale budget by investment factor
         budget_impact = round(base_budget * investment_factor * urgency_multiplier)
         
-        # If we have company data, scale budget to company size
-        if company_profile.is_loaded and 'total_revenue' in company_profile.metrics:
-            revenue_scale = company_profile.metrics['total_revenue'] / 10000000  # vs $10M baseline
-            budget_impact = round(budget_impact * revenue_scale)
-        
-        # Scale headcount by timeline and company size
+        # Scale headcount by timeline
         headcount_impact = round(config["base_headcount"] * timeline_factor)
         
-        # If we have company data, scale headcount proportionally
-        if company_profile.is_loaded and 'current_headcount' in company_profile.metrics:
-            headcount_scale = company_profile.metrics['current_headcount'] / 620  # vs 620 baseline
-            headcount_impact = round(headcount_impact * headcount_scale)
-        
         # Adjust confidence
         base_conf = config["base_confidence"]
         confidence = int(min(99, max(50, base_conf * timeline_factor * (1 - config["risk_factor"] * 0.3))))
         
+        # Scale to company size and this agent's department (actual spend share and headcount when uploaded)
+        adjusted = profile.adjust_calculations({
+            "budgetImpact": budget_impact,
+            "headcountImpact": headcount_impact,
+            "confidence": confidence
+        }, name)
+        budget_impact = adjusted["budgetImpact"]
+        headcount_impact = adjusted["headcountImpact"]
+        confidence = adjusted["confidence"]
+        
         # Determine risk level
         if confidence >= 85:
             risk = "low"
@@ -325,19 +431,7 @@ def calculate_agent_decisions(parsed: Dict[str, Any], investment: float, timelin
         else:
             risk = "high"
         
-        # Format decision text
-        decision = config["base_decision"].format(
-            action=action,
-            reverse_action=reverse_action,
-            percentage=percentage,
-            number=number,
-            margin=margin
-        )
-        
-        # Format trigger
-        trigger = config["trigger"].format(
-            reverse_action=reverse_action.lower()
-        )
+        decision, trigger = format_agent_text(name, terms)
         
         agents.append(AgentDecision(
             name=name,
@@ -353,74 +447,127 @@ def calculate_agent_decisions(parsed: Dict[str, Any], investment: float, timelin
     
     return agents
 
-def generate_conflicts(parsed: Dict[str, Any], agents: List[AgentDecision]) -> List[ConflictData]:
-    """Generate conflicts based on parsed intent"""
+def headcount_reduction_limit(parsed: Dict[str, Any], profile: ProfileSnapshot) -> float:
+    """Maximum workforce reduction the plan may absorb, based on urgency"""
+    urgency = parsed.get("urgency_level", "medium")
+    current_headcount = profile.metrics.get('current_headcount', 620) if profile.is_loaded else 620
+    return current_headcount * HEADCOUNT_REDUCTION_LIMITS.get(urgency, 0.02)
+
+def generate_conflicts(parsed: Dict[str, Any], agents: List[AgentDecision], investment: float,
+                       profile: ProfileSnapshot) -> tuple:
+    """Solve the budget/headcount allocation and report agents competing for a binding constraint
+
+    Investments left unfunded because their expected return is below cost are reported too.
+    Returns the funded share of each agent's plan (apply with apply_allocation) and the conflicts.
+    """
+    allocation = optimize_allocation(agents, investment, headcount_reduction_limit(parsed, profile))
+    shares = [float(x) for x in allocation.allocation]
     conflicts = []
     
-    obj_type = parsed.get("objective_type", "efficiency")
-    tension = parsed.get("inherent_tension")
-    
-    # Calculate dynamic values based on parsed data
-    target_pct = parsed.get('target_percentage', 15)
-    secondary_pct = parsed.get('secondary_percentage', target_pct * 0.15)
-    investment = parsed.get('investment_limit', 620000)
-    
-    if obj_type == "profit" and parsed.get("secondary_objective"):
-        # Dual objective conflict
-        auto_pct = int(target_pct * 0.6)
-        conflicts.append(ConflictData(
-            id=1,
-            conflict="Growth vs Efficiency",
-            versus="Cost Reduction Pressure",
-            resolution=f"APPROVED: Prioritize automation over headcount reduction. Target {target_pct}% profit growth with {secondary_pct:.1f}% cost reduction.",
-            status="resolved",
-            agents=["HR", "Operations"],
-            savingsImpact=int(investment * 0.12)
-        ))
+    for i, pair in enumerate(find_conflicts(allocation), start=1):
+        curtailed = agents[pair["curtailed_index"]]
+        if pair["constraint"] == "budget":
+            label = "Budget Allocation"
+            limit_text = f"${pair['limit']:,.0f} investment limit"
+        else:
+            label = "Headcount Plan"
+            limit_text = f"{pair['limit']:.0f}-person reduction cap"
         
         conflicts.append(ConflictData(
-            id=2,
-            conflict="Marketing Spend",
-            versus="CAC Targets",
-            resolution=f"APPROVED: Shift {auto_pct}% budget to performance channels to maintain CAC at ${parsed.get('avg_cac', 385):.0f}",
-            status="resolved",
-            agents=["Marketing", "Finance"],
-            savingsImpact=int(investment * 0.17)
-        ))
-    elif obj_type == "cost_reduction":
-        phase_weeks = int(parsed.get('timeline_weeks', 12) / 4)
-        conflicts.append(ConflictData(
-            id=1,
-            conflict="Deep Cost Cutting",
-            versus="Service Quality Maintenance",
-            resolution=f"APPROVED: Phase {target_pct}% cost cuts over {phase_weeks} weeks with quality checkpoints at weeks {phase_weeks}, {phase_weeks*2}, {phase_weeks*3}",
+            id=i,
+            conflict=f"{pair['funded']} {label}",
+            versus=f"{pair['curtailed']} {label}",
+            resolution=f"APPROVED: Fund {pair['funded']} at {pair['funded_share']:.0%}, scale {pair['curtailed']} to {pair['curtailed_share']:.0%} to stay within {limit_text}",
             status="resolved",
-            agents=["Operations", "Support", "Finance"],
-            savingsImpact=int(investment * 0.35)
+            agents=[pair["funded"], pair["curtailed"]],
+            # Budget impact given up (negative) or spend avoided (positive) by scaling back
+            savingsImpact=-int(curtailed.budgetImpact * (1 - pair["curtailed_share"]))
         ))
-    elif obj_type == "revenue":
-        conflicts.append(ConflictData(
-            id=1,
-            conflict="Aggressive Growth",
-            versus="Resource Constraints",
-            resolution=f"APPROVED: Reallocate ${investment * 0.25:,.0f} from reserves to support {target_pct}% revenue growth target",
-            status="resolved",
-            agents=["Sales", "Marketing", "Finance"],
-            savingsImpact=-int(investment * 0.25)
-        ))
-    else:
-        # Default conflict for efficiency or other objectives
+    
+    # Investments dropped because they are not expected to pay back, not because of a limit
+    for item in find_unfunded(allocation):
+        agent = agents[item["index"]]
         conflicts.append(ConflictData(
-            id=1,
-            conflict="Efficiency Optimization",
-            versus="Business Continuity",
-            resolution=f"APPROVED: Implement {target_pct}% efficiency gains with zero disruption protocol over {parsed.get('timeline_weeks', 12)} weeks",
+            id=len(conflicts) + 1,
+            conflict=f"{item['name']} Investment",
+            versus="Expected Return",
+            resolution=f"NOT FUNDED: expected return below cost (${item['expected_return']:.2f} per $1 at {agent.confidence}% confidence, {agent.risk} risk); funded at {item['share']:.0%}",
             status="resolved",
-            agents=["Operations", "Finance"],
-            savingsImpact=int(investment * 0.19)
+            agents=[item["name"]],
+            savingsImpact=-int(agent.budgetImpact * (1 - item["share"]))
         ))
     
-    return conflicts
+    return shares, conflicts
+
+def apply_allocation(agents: List[AgentDecision], shares: List[float]) -> List[AgentDecision]:
+    """Scale each agent's budget and headcount impact to the funded share of its plan"""
+    scaled = []
+    for agent, share in zip(agents, shares):
+        if share >= 1 - ALLOCATION_EPS:
+            scaled.append(agent)
+            continue
+        scaled.append(agent.copy(update={
+            "budgetImpact": float(round(agent.budgetImpact * share)),
+            # Truncate toward zero so rounding never pushes past the headcount cap
+            "headcountImpact": int(agent.headcountImpact * share),
+            "decision": f"{agent.decision} Funded at {share:.0%} of plan."
+        }))
+    return scaled
+
+def scenario_key(parsed: Dict[str, Any], timeline: int) -> tuple:
+    """Inputs that determine agent budgets/headcount and conflicts (objective type and
+    target percentage only affect text and headline metrics, applied at lookup)"""
+    return (
+        parsed.get("budget_implication", "reallocate"),
+        parsed.get("urgency_level", "medium"),
+        round(get_timeline_factor(timeline), 4)
+    )
+
+def build_scenario_table(profile_version: int):
+    """Precompute agent decisions and conflicts for every common scenario of a profile version"""
+    profile = company_profile.snapshot
+    if profile.version != profile_version:
+        # A newer upload replaced this profile; its own build is already scheduled
+        return
+    
+    keys = sorted({
+        scenario_key({"budget_implication": budget_impl, "urgency_level": urgency}, timeline)
+        for budget_impl in ["cut_costs", "invest", "reallocate", "maintain"]
+        for urgency in ["low", "medium", "high"]
+        for timeline in COMMON_TIMELINES
+    })
+    
+    def compute(key: tuple, investment: float) -> tuple:
+        budget_impl, urgency, timeline_factor = key
+        parsed = {"budget_implication": budget_impl, "urgency_level": urgency}
+        agents = calculate_agent_decisions(parsed, investment, timeline_factor * 12, profile)
+        return agents, generate_conflicts(parsed, agents, investment, profile)
+    
+    try:
+        scenario_table.build(profile_version, keys, get_base_investment(profile), compute, extra_investments=[620000])
+    except Exception as e:
+        print(f"Scenario table build failed: {e}")
+
+def lookup_precomputed(parsed: Dict[str, Any], investment: float, timeline: int,
+                       profile: ProfileSnapshot) -> Optional[tuple]:
+    """Allocated agent decisions and conflicts from the precomputed table, or None if not covered"""
+    entry = scenario_table.lookup(profile.version, scenario_key(parsed, timeline))
+    budgets = entry.interpolate_budgets(investment) if entry else None
+    if budgets is None:
+        return None
+    
+    terms = decision_terms(parsed.get("budget_implication", "reallocate"), parsed.get("target_percentage", 15))
+    agents = []
+    for template, budget in zip(entry.agents, budgets):
+        decision, trigger = format_agent_text(template.name, terms)
+        agents.append(template.copy(update={"budgetImpact": float(budget), "decision": decision, "trigger": trigger}))
+    
+    # Allocations are stored per grid point; off-grid investments re-solve the small LP
+    resolution = entry.resolution_at(investment)
+    if resolution is None:
+        resolution = generate_conflicts(parsed, agents, investment, profile)
+    shares, conflicts = resolution
+    return apply_allocation(agents, shares), conflicts
 
 def generate_projections(parsed: Dict[str, Any], timeline: int) -> tuple:
     """Generate profit and CTC projection data for charts"""
@@ -463,34 +610,47 @@ def generate_projections(parsed: Dict[str, Any], timeline: int) -> tuple:
     return profit_data, ctc_data
 
 @app.post("/api/calculate", response_model=CalculatedMetrics)
-async def calculate_endpoint(data: CEOPrompt):
+async def calculate_endpoint(data: CEOPrompt, x_tenant_id: Optional[str] = Header(None)):
     """Main endpoint: Parse prompt with Gemini and calculate metrics"""
     try:
         # Step 1: Parse the CEO prompt with Gemini
         parsed = await parse_with_gemini(data.prompt)
+        # One profile snapshot for the whole calculation, even if an upload lands meanwhile
+        profile = company_profile.snapshot
         
-        # Step 2: Calculate agent decisions
-        agents = calculate_agent_decisions(
-            parsed, 
+        # Step 2: Look up agent decisions and conflicts in the precomputed table,
+        # computing them directly when the scenario is not covered
+        precomputed = lookup_precomputed(
+            parsed,
             data.investment_limit or 620000,
-            data.timeline_weeks or 12
+            data.timeline_weeks or 12,
+            profile
         )
+        if precomputed:
+            agents, conflicts = precomputed
+        else:
+            agents = calculate_agent_decisions(
+                parsed, 
+                data.investment_limit or 620000,
+                data.timeline_weeks or 12,
+                profile
+            )
+            shares, conflicts = generate_conflicts(parsed, agents, data.investment_limit or 620000, profile)
+            # Scale agents to the solved allocation so totals respect the limits
+            agents = apply_allocation(agents, shares)
         
         # Step 3: Calculate totals
         total_savings = sum(a.budgetImpact for a in agents)
         total_headcount = sum(a.headcountImpact for a in agents)
         avg_confidence = int(sum(a.confidence for a in agents) / len(agents))
         
-        # Step 4: Generate conflicts
-        conflicts = generate_conflicts(parsed, agents)
-        
-        # Step 5: Generate chart projections
+        # Step 4: Generate chart projections
         profit_proj, ctc_proj = generate_projections(
             parsed, 
             data.timeline_weeks or 12
         )
         
-        # Step 6: Determine final metrics
+        # Step 5: Determine final metrics
         obj_type = parsed.get("objective_type", "efficiency")
         target_pct = parsed.get("target_percentage", 15)
         
@@ -507,7 +667,7 @@ async def calculate_endpoint(data: CEOPrompt):
             profit_growth = target_pct * 0.8
             ctc_reduction = target_pct * 0.1
         
-        return CalculatedMetrics(
+        result = CalculatedMetrics(
             profitGrowth=round(profit_growth, 1),
             ctcReduction=round(ctc_reduction, 1),
             overallConfidence=avg_confidence,
@@ -519,6 +679,23 @@ async def calculate_endpoint(data: CEOPrompt):
             conflicts=[c.dict() for c in conflicts]
         )
         
+        # Step 6: Push the recomputed scenario summary to the tenant's open dashboards
+        tenant = x_tenant_id or "default"
+        broadcaster.publish("scenario", scenario_summary(result, data.prompt), tenant=tenant)
+        
+        # Step 7: Queue the scenario for the history store (written off the request path)
+        scenario_history.record(
+            tenant=tenant,
+            prompt=data.prompt,
+            parsed=parsed,
+            result=result,
+            profile_version=profile.version,
+            investment_limit=data.investment_limit or 620000,
+            timeline_weeks=data.timeline_weeks or 12
+        )
+        
+        return result
+        
     except Exception as e:
         import traceback
         print(f"Error: {e}")
@@ -529,16 +706,30 @@ async def calculate_endpoint(data: CEOPrompt):
 async def upload_data(file: UploadFile = File(...)):
     """Upload company data (CSV or Excel)"""
     try:
+        broadcaster.publish("upload", {"filename": file.filename, "stage": "receiving"})
         content = await file.read()
-        result = company_profile.process_csv(content)
+        broadcaster.publish("upload", {"filename": file.filename, "stage": "processing", "bytes": len(content)})
+        result = await run_in_threadpool(company_profile.process_csv, content)
+        broadcaster.publish("upload", {"filename": file.filename, "stage": "complete" if result["status"] == "success" else "failed", "message": result["message"]})
+        if result["status"] == "success":
+            # Build off the request so the response, and its admission slot, are not held until the table is done
+            asyncio.get_running_loop().run_in_executor(None, build_scenario_table, result["profile_version"])
+            profile = company_profile.snapshot
+            broadcaster.publish("profile", {
+                "profile_version": profile.version,
+                "loaded_at": profile.loaded_at,
+                "metrics": profile.metrics
+            })
         return result
     except Exception as e:
+        broadcaster.publish("upload", {"filename": file.filename, "stage": "failed", "message": str(e)})
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/api/company-data")
 async def get_company_data():
     """Get current loaded company data"""
-    if not company_profile.is_loaded:
+    profile = company_profile.snapshot
+    if not profile.is_loaded:
         return {
             "status": "no_data",
             "message": "No company data uploaded yet. Using default baselines."
@@ -546,19 +737,109 @@ async def get_company_data():
     
     return {
         "status": "loaded",
-        "metrics": company_profile.metrics,
-        "detected_columns": list(company_profile.raw_data.keys())
+        "profile_version": profile.version,
+        "metrics": profile.metrics,
+        "detected_columns": list(profile.raw_data.keys()),
+        "departments": profile.department_baselines,
+        "department_period_count": len(profile.department_periods)
     }
 
+@app.get("/api/company-data/department-periods")
+async def get_department_periods(department: Optional[str] = None, offset: int = 0, limit: int = 100):
+    """Page through the uploaded department x period aggregates"""
+    return company_profile.department_period_page(department=department, offset=offset, limit=limit)
+
 @app.get("/api/health")
 async def health_check():
     return {
         "status": "healthy",
         "service": "agentic-enterprise-api",
         "gemini_available": bool(GEMINI_API_KEY),
-        "company_data_loaded": company_profile.is_loaded
+        "gemini_usage": gemini_usage,
+        "company_data_loaded": company_profile.is_loaded,
+        "profile_version": company_profile.version,
+        "live_updates": broadcaster.stats(),
+        "scenario_history": scenario_history.stats(),
+        "admission": admission.stats(),
+        "scenario_table": scenario_table.stats()
     }
 
+@app.get("/api/scenarios")
+def list_scenarios(
+    tenant: Optional[str] = None,
+    objective_type: Optional[str] = None,
+    fingerprint: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    cursor: Optional[int] = None,
+    limit: int = 50
+):
+    """Page through past calculations, newest first (pass next_cursor as cursor)
+
+    Plain def: FastAPI runs the blocking SQLite query in its threadpool.
+    """
+    return scenario_history.query(
+        tenant=tenant,
+        objective_type=objective_type,
+        fingerprint=fingerprint,
+        since=since,
+        until=until,
+        before_id=cursor,
+        limit=limit
+    )
+
+@app.get("/api/scenarios/export")
+async def export_scenarios(
+    tenant: Optional[str] = None,
+    objective_type: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None
+):
+    """Download matching scenarios in the compact binary export format"""
+    return StreamingResponse(
+        scenario_history.export(tenant=tenant, objective_type=objective_type, since=since, until=until),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": "attachment; filename=scenario_history.bin"}
+    )
+
+@app.get("/api/scenarios/{scenario_id}")
+def get_scenario(scenario_id: int):
+    """Full stored scenario including parsed intent and calculation result"""
+    scenario = scenario_history.get(scenario_id)
+    if scenario is None:
+        raise HTTPException(status_code=404, detail="Scenario not found")
+    return scenario
+
+@app.on_event("startup")
+async def start_background_workers():
+    scenario_history.start()
+    # Build the table for the default baseline without delaying startup
+    asyncio.get_running_loop().run_in_executor(None, build_scenario_table, company_profile.version)
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    scenario_history.stop()
+
+@app.get("/api/events")
+async def event_stream(tenant: Optional[str] = None, x_tenant_id: Optional[str] = Header(None)):
+    """Server-Sent Events channel for profile, upload and the tenant's scenario updates
+
+    EventSource cannot set headers, so the tenant may also be given as ?tenant=.
+    """
+    subscriber = broadcaster.subscribe(tenant or x_tenant_id or "default")
+    return StreamingResponse(
+        broadcaster.sse_stream(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/api/ws")
+async def websocket_updates(websocket: WebSocket, tenant: Optional[str] = None):
+    """WebSocket channel carrying the same events as /api/events"""
+    tenant = tenant or websocket.headers.get("x-tenant-id") or "default"
+    await websocket.accept()
+    await broadcaster.websocket_stream(broadcaster.subscribe(tenant), websocket)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
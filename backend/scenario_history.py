@@ -0,0 +1,335 @@
+"""
+Scenario History - Append-only store of /api/calculate results
+Writes are batched on a background thread; reads page through indexed SQLite tables
+"""
+import hashlib
+import json
+import os
+import queue
+import re
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, Any, Optional, List, Iterator
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenario_history.db")
+
+# Writer flushes when this many records are pending or the interval elapses
+BATCH_SIZE = 200
+FLUSH_INTERVAL_SECONDS = 0.5
+
+# Pending records held in memory before new ones are dropped
+MAX_PENDING = 10000
+
+MAX_PAGE_SIZE = 200
+
+# Binary export: file header, then one length-prefixed record per scenario
+EXPORT_MAGIC = b"AESH1"
+EXPORT_RECORD = struct.Struct("<qdIi8sHHI")
+INT32_MAX = 2 ** 31 - 1
+UINT32_MAX = 2 ** 32 - 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenarios (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    tenant TEXT NOT NULL,
+    objective_type TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    profile_version INTEGER NOT NULL,
+    investment_limit REAL,
+    timeline_weeks INTEGER,
+    profit_growth REAL,
+    ctc_reduction REAL,
+    total_savings REAL,
+    overall_confidence INTEGER,
+    payload BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_scenarios_time ON scenarios(created_at);
+CREATE INDEX IF NOT EXISTS idx_scenarios_objective ON scenarios(objective_type, id);
+CREATE INDEX IF NOT EXISTS idx_scenarios_tenant ON scenarios(tenant, id);
+CREATE INDEX IF NOT EXISTS idx_scenarios_fingerprint ON scenarios(fingerprint, id);
+CREATE TRIGGER IF NOT EXISTS scenarios_no_update BEFORE UPDATE ON scenarios
+BEGIN SELECT RAISE(ABORT, 'scenario history is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS scenarios_no_delete BEFORE DELETE ON scenarios
+BEGIN SELECT RAISE(ABORT, 'scenario history is append-only'); END;
+"""
+
+SUMMARY_COLUMNS = [
+    "id", "created_at", "tenant", "objective_type", "fingerprint", "prompt", "profile_version",
+    "investment_limit", "timeline_weeks", "profit_growth", "ctc_reduction", "total_savings",
+    "overall_confidence",
+]
+
+INSERT_SQL = f"""
+INSERT INTO scenarios ({", ".join(SUMMARY_COLUMNS[1:])}, payload)
+VALUES ({", ".join("?" * len(SUMMARY_COLUMNS))})
+"""
+
+
+def prompt_fingerprint(prompt: str) -> str:
+    """Stable fingerprint of a directive, insensitive to case and whitespace"""
+    normalized = re.sub(r"\s+", " ", prompt.strip().lower())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+class ScenarioHistory:
+    """Append-only scenario log with a batching background writer"""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self.pending: queue.Queue = queue.Queue(maxsize=MAX_PENDING)
+        self.dropped = 0
+        self.failed = 0
+        self._writer: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self, check_same_thread: bool = True) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=check_same_thread)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _ensure_schema(self):
+        if self._initialized:
+            return
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+        self._initialized = True
+
+    def start(self):
+        """Start the background writer (idempotent)"""
+        with self._lock:
+            if self._writer and self._writer.is_alive():
+                return
+            self._ensure_schema()
+            self._stop.clear()
+            self._writer = threading.Thread(target=self._run_writer, name="scenario-history-writer", daemon=True)
+            self._writer.start()
+
+    def stop(self):
+        """Flush pending records and stop the writer"""
+        self._stop.set()
+        if self._writer:
+            self._writer.join(timeout=5)
+
+    def record(self, tenant: str, prompt: str, parsed: Dict[str, Any], result: Any,
+               profile_version: int, investment_limit: float, timeline_weeks: int):
+        """Queue a calculation for storage; never blocks the request"""
+        if not self._writer or not self._writer.is_alive():
+            self.start()
+        try:
+            self.pending.put_nowait((time.time(), tenant, prompt, parsed, result,
+                                     profile_version, investment_limit, timeline_weeks))
+        except queue.Full:
+            self.dropped += 1
+
+    def _to_row(self, item) -> tuple:
+        created_at, tenant, prompt, parsed, result, profile_version, investment_limit, timeline_weeks = item
+        payload = zlib.compress(json.dumps({
+            "parsed": parsed,
+            "result": result.dict(),
+        }, separators=(",", ":"), default=str).encode("utf-8"))
+        return (
+            created_at, tenant, parsed.get("objective_type", "efficiency"), prompt_fingerprint(prompt),
+            prompt, profile_version, investment_limit, timeline_weeks, result.profitGrowth,
+            result.ctcReduction, result.totalSavings, result.overallConfidence, payload,
+        )
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: list):
+        """Insert a batch in one transaction; on failure retry row by row so only bad records are lost"""
+        rows = []
+        for item in batch:
+            try:
+                rows.append(self._to_row(item))
+            except Exception as e:
+                self.failed += 1
+                print(f"Scenario history record skipped: {e}")
+        try:
+            with conn:
+                conn.executemany(INSERT_SQL, rows)
+            return
+        except sqlite3.Error as e:
+            print(f"Scenario history batch write failed ({len(rows)} records), retrying individually: {e}")
+
+        for row in rows:
+            try:
+                with conn:
+                    conn.execute(INSERT_SQL, row)
+            except sqlite3.Error as e:
+                self.failed += 1
+                print(f"Scenario history record rejected: {e}")
+
+    def _run_writer(self):
+        conn = self._connect()
+        try:
+            while True:
+                batch = []
+                deadline = time.monotonic() + FLUSH_INTERVAL_SECONDS
+                while len(batch) < BATCH_SIZE:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(self.pending.get(timeout=timeout))
+                    except queue.Empty:
+                        break
+                if batch:
+                    self._write_batch(conn, batch)
+                elif self._stop.is_set():
+                    return
+        finally:
+            conn.close()
+
+    def _where(self, tenant: Optional[str], objective_type: Optional[str], fingerprint: Optional[str],
+               since: Optional[float], until: Optional[float], before_id: Optional[int]):
+        clauses, params = [], []
+        for column, value in (("tenant", tenant), ("objective_type", objective_type), ("fingerprint", fingerprint)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        if before_id is not None:
+            clauses.append("id < ?")
+            params.append(before_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def query(self, tenant: Optional[str] = None, objective_type: Optional[str] = None,
+              fingerprint: Optional[str] = None, since: Optional[float] = None,
+              until: Optional[float] = None, before_id: Optional[int] = None,
+              limit: int = 50) -> Dict[str, Any]:
+        """Newest-first page of scenario summaries; pass next_cursor back as before_id"""
+        self._ensure_schema()
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        where, params = self._where(tenant, objective_type, fingerprint, since, until, before_id)
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM scenarios {where} ORDER BY id DESC LIMIT ?",
+                params + [limit + 1]
+            ).fetchall()
+        finally:
+            conn.close()
+
+        items = [dict(zip(SUMMARY_COLUMNS, row)) for row in rows[:limit]]
+        return {
+            "items": items,
+            "next_cursor": items[-1]["id"] if len(rows) > limit else None,
+        }
+
+    def get(self, scenario_id: int) -> Optional[Dict[str, Any]]:
+        """Full stored scenario including the parsed intent and calculation result"""
+        self._ensure_schema()
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                f"SELECT {', '.join(SUMMARY_COLUMNS)}, payload FROM scenarios WHERE id = ?",
+                (scenario_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        scenario = dict(zip(SUMMARY_COLUMNS, row[:-1]))
+        scenario.update(json.loads(zlib.decompress(row[-1])))
+        return scenario
+
+    def export(self, tenant: Optional[str] = None, objective_type: Optional[str] = None,
+               since: Optional[float] = None, until: Optional[float] = None) -> Iterator[bytes]:
+        """Stream matching scenarios in the compact binary export format (oldest first)
+
+        Each record is EXPORT_RECORD (id, created_at, profile_version, timeline_weeks,
+        fingerprint bytes, tenant/objective/payload lengths) followed by the UTF-8 tenant,
+        UTF-8 objective type and the zlib-compressed JSON payload. See read_export().
+        """
+        self._ensure_schema()
+        where, params = self._where(tenant, objective_type, None, since, until, None)
+        # StreamingResponse advances this generator from whichever threadpool worker is free;
+        # the connection is still only used by this one export at a time
+        conn = self._connect(check_same_thread=False)
+        try:
+            yield EXPORT_MAGIC
+            cursor = conn.execute(
+                f"""SELECT id, created_at, profile_version, timeline_weeks, fingerprint, tenant,
+                    objective_type, payload FROM scenarios {where} ORDER BY id""",
+                params
+            )
+            while True:
+                rows = cursor.fetchmany(500)
+                if not rows:
+                    break
+                chunk = bytearray()
+                for row in rows:
+                    try:
+                        chunk += self._export_record(*row)
+                    except (struct.error, ValueError, TypeError) as e:
+                        # A record that cannot be encoded must not abort the rest of the stream
+                        print(f"Scenario history export skipped record {row[0]}: {e}")
+                yield bytes(chunk)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _export_record(row_id, created_at, version, weeks, fingerprint, tenant_name, objective, payload) -> bytes:
+        tenant_bytes = tenant_name.encode("utf-8")
+        objective_bytes = objective.encode("utf-8")
+        # Out-of-range values (stored before inputs were validated) are written as 0 = unknown
+        version = version if 0 <= version <= UINT32_MAX else 0
+        weeks = weeks if weeks is not None and -INT32_MAX <= weeks <= INT32_MAX else 0
+        return EXPORT_RECORD.pack(row_id, created_at, version, weeks, bytes.fromhex(fingerprint),
+                                  len(tenant_bytes), len(objective_bytes), len(payload)) \
+            + tenant_bytes + objective_bytes + payload
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending_writes": self.pending.qsize(),
+            "dropped_writes": self.dropped,
+            "failed_writes": self.failed,
+        }
+
+
+def read_export(data: bytes) -> List[Dict[str, Any]]:
+    """Decode a binary export produced by ScenarioHistory.export()"""
+    if not data.startswith(EXPORT_MAGIC):
+        raise ValueError("Not a scenario history export")
+    records = []
+    offset = len(EXPORT_MAGIC)
+    while offset < len(data):
+        row_id, created_at, version, weeks, fingerprint, tenant_len, objective_len, payload_len = \
+            EXPORT_RECORD.unpack_from(data, offset)
+        offset += EXPORT_RECORD.size
+        tenant = data[offset:offset + tenant_len].decode("utf-8")
+        offset += tenant_len
+        objective = data[offset:offset + objective_len].decode("utf-8")
+        offset += objective_len
+        payload = json.loads(zlib.decompress(data[offset:offset + payload_len]))
+        offset += payload_len
+        records.append({
+            "id": row_id,
+            "created_at": created_at,
+            "profile_version": version,
+            "timeline_weeks": weeks,
+            "fingerprint": fingerprint.hex(),
+            "tenant": tenant,
+            "objective_type": objective,
+            **payload,
+        })
+    return records
+
+
+# Global instance shared by all endpoints
+scenario_history = ScenarioHistory(os.getenv("SCENARIO_DB_PATH", DEFAULT_DB_PATH))
@@ -0,0 +1,111 @@
+"""
+Scenario Table - Precomputed agent/conflict results per company profile version
+Built in the background after each upload; /api/calculate does a lookup plus
+log-log interpolation of agent budgets between investment grid points.
+"""
+import threading
+import time
+import numpy as np
+from typing import Dict, List, Any, Optional, Callable, Hashable, Sequence
+
+# Investment grid as multiples of the profile's base investment (log-spaced)
+INVESTMENT_MULTIPLES = [0.125, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0]
+
+# Timelines commonly requested from the dashboard, in weeks
+COMMON_TIMELINES = [4, 6, 8, 10, 12, 16, 26, 52]
+
+
+class TableEntry:
+    """Results for one scenario key across the investment grid"""
+
+    def __init__(self, investments: np.ndarray, agents: List[Any], budgets: np.ndarray, resolutions: List[Any]):
+        self.investments = investments
+        self.log_investments = np.log(investments)
+        self.agents = agents
+        self.budgets = budgets
+        self.resolutions = resolutions
+
+    def interpolate_budgets(self, investment: float) -> Optional[np.ndarray]:
+        """Agent budget impacts at an investment inside the grid, else None
+
+        Budgets scale as a power of the investment, so interpolation is linear in
+        log-log space wherever a budget keeps its sign across the bracket.
+        """
+        if investment < self.investments[0] or investment > self.investments[-1]:
+            return None
+        hi = int(np.searchsorted(self.investments, investment))
+        if self.investments[hi] == investment:
+            return self.budgets[hi].copy()
+        lo = hi - 1
+        t = (np.log(investment) - self.log_investments[lo]) / (self.log_investments[hi] - self.log_investments[lo])
+        b_lo, b_hi = self.budgets[lo], self.budgets[hi]
+
+        same_sign = (b_lo * b_hi) > 0
+        linear = b_lo + (b_hi - b_lo) * t
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_log = np.sign(b_lo) * np.exp(np.log(np.abs(b_lo)) * (1 - t) + np.log(np.abs(b_hi)) * t)
+        return np.round(np.where(same_sign, log_log, linear))
+
+    def resolution_at(self, investment: float) -> Optional[Any]:
+        """Precomputed allocation/conflicts when the investment is exactly a grid point"""
+        matches = np.flatnonzero(self.investments == investment)
+        return self.resolutions[matches[0]] if matches.size else None
+
+
+class ScenarioTable:
+    """Scenario key -> TableEntry for a single company profile version"""
+
+    def __init__(self):
+        self.profile_version: Optional[int] = None
+        self.entries: Dict[Hashable, TableEntry] = {}
+        self.build_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def build(self, profile_version: int, keys: Sequence[Hashable], base_investment: float,
+              compute: Callable[[Hashable, float], tuple], extra_investments: Sequence[float] = ()):
+        """Evaluate compute(key, investment) -> (agents, resolution) over the grid for every key
+
+        Agents are the unallocated plan (their budgets are interpolated); the resolution
+        is stored as-is per grid point.
+
+        The new table replaces the old one atomically once complete.
+        """
+        start = time.perf_counter()
+        investments = np.unique(np.array(
+            [base_investment * m for m in INVESTMENT_MULTIPLES] + list(extra_investments), dtype=float
+        ))
+
+        entries = {}
+        for key in keys:
+            agents_at, resolutions = [], []
+            for investment in investments:
+                agents, resolution = compute(key, float(investment))
+                agents_at.append(agents)
+                resolutions.append(resolution)
+            budgets = np.array([[a.budgetImpact for a in agents] for agents in agents_at], dtype=np.float64)
+            entries[key] = TableEntry(investments, agents_at[0], budgets, resolutions)
+
+        with self._lock:
+            # A newer profile may have been built while this one was running
+            if self.profile_version is not None and self.profile_version > profile_version:
+                return
+            self.entries = entries
+            self.profile_version = profile_version
+            self.build_seconds = time.perf_counter() - start
+        print(f"Scenario table built for profile v{profile_version}: {len(entries)} keys in {self.build_seconds:.2f}s")
+
+    def lookup(self, profile_version: int, key: Hashable) -> Optional[TableEntry]:
+        if self.profile_version != profile_version:
+            return None
+        return self.entries.get(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "profile_version": self.profile_version,
+            "keys": len(self.entries),
+            "build_seconds": round(self.build_seconds, 3),
+        }
+
+
+# Global instance shared by all endpoints
+scenario_table = ScenarioTable()